@@ -1,10 +1,20 @@
 import asyncio
+import functools
 import io
+import multiprocessing
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass, field
+from hashlib import blake2b
 from typing import Literal
 
+import ahocorasick
 from meme_generator import Meme, get_memes
 from meme_generator.version import __version__
+from packaging.version import Version
 
 from astrbot import logger
 from astrbot.core.config.astrbot_config import AstrBotConfig
@@ -12,86 +22,169 @@ from astrbot.core.platform.astr_message_event import AstrMessageEvent
 
 from .param import ParamsCollector
 
+# 0.2.0 之前为纯 Python 实现，之后为 Rust 实现，两者接口不同
+_IS_PY_VERSION = Version(__version__) < Version("0.2.0")
 
-@dataclass
+if _IS_PY_VERSION:
+    from meme_generator.download import check_resources as _check_resources
+    from meme_generator.utils import render_meme_list as _render_meme_list
+    from meme_generator.utils import run_sync as _run_sync
+else:
+    from meme_generator.resources import (
+        check_resources_in_background as _check_resources,
+    )
+    from meme_generator.tools import MemeProperties as _MemeProperties
+    from meme_generator.tools import MemeSortBy as _MemeSortBy
+    from meme_generator.tools import render_meme_list as _render_meme_list
+
+    from .render import generate_meme as _generate_meme
+    from .render import render_worker as _render_worker
+
+
+@dataclass(slots=True)
 class MemeProperties:
     disabled: bool = False
     labels: list[Literal["new", "hot"]] = field(default_factory=list)
 
 
 class MemeManager:
-    is_py_version = tuple(map(int, __version__.split("."))) < (0, 2, 0)
     def __init__(self, config: AstrBotConfig, collect: ParamsCollector):
         self.conf = config
         self.collect = collect
+        # 可选的 meme 生成进程池，按需创建
+        self._render_pool: ProcessPoolExecutor | None = None
+        # meme 列表图只依赖已加载的 memes，渲染一次后缓存
+        self._rendered_list_cache: bytes | None = None
+        self._render_lock = asyncio.Lock()
+        # 正在生成中的 meme，相同参数的并发请求共用同一个任务
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        # 最近生成结果的 LRU 缓存，相同图片+参数直接复用（meme_cache_size 为 0 时不启用）
+        self._render_cache: OrderedDict[tuple, bytes] = OrderedDict()
+        # memes 在 initialize 时于线程池中加载，加载完成前同步接口一律视为未匹配
+        self._memes_loaded = False
+        self._load_failed = False
+        self._load_lock = threading.Lock()
 
-        if self.is_py_version:
-            from meme_generator.download import check_resources
-            from meme_generator.utils import run_sync, render_meme_list
-            self.render_meme_list = render_meme_list
-            self.check_resources_func = check_resources
-            self.run_sync = run_sync
-        else:
-            from meme_generator.tools import MemeProperties, MemeSortBy, render_meme_list
-            from meme_generator.resources import check_resources_in_background
-            from meme_generator import Image as MemeImage
-            self.render_meme_list = render_meme_list
-            self.check_resources_func = check_resources_in_background
-            self.MemeImage = MemeImage
+    def _ensure_memes_loaded(self):
+        """只在线程池中调用，事件循环线程不会等待 _load_lock"""
+        with self._load_lock:
+            if self._memes_loaded or self._load_failed:
+                return
+            try:
+                self._load_memes()
+            except Exception as e:
+                # 失败后不再重试，避免每条消息都触发一次完整加载
+                self._load_failed = True
+                logger.error(f"memes加载失败: {e}")
+
+    async def load_memes(self):
+        """在线程池中加载 memes，避免阻塞事件循环"""
+        if self._memes_loaded or self._load_failed:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._ensure_memes_loaded)
+
+    def _load_memes(self):
+        """加载 memes 并构建关键词索引"""
         self.memes: list[Meme] = get_memes()
-        self.meme_keywords = [
-            k
-            for m in self.memes
-            for k in (m.keywords if self.is_py_version else m.info.keywords)
-        ]
+        # 单次遍历同时构建各索引：
+        # _info: 预先解析各版本的 (keywords, params, tags)，避免每次调用都分支取属性
+        # _meme_by_kw: 关键词/key -> meme 的直接索引
+        # _automaton: 模糊匹配用的 Aho-Corasick 自动机，一次扫描即可定位消息中的关键词
+        self._info = {}
+        self._meme_by_kw: dict[str, Meme] = {}
+        self.meme_keywords = []
+        self._automaton = ahocorasick.Automaton()
+        for m in self.memes:
+            kws, params, tags = (
+                (m.keywords, m.params_type, m.tags)
+                if _IS_PY_VERSION
+                else (m.info.keywords, m.info.params, m.info.tags)
+            )
+            self._info[m.key] = (kws, params, tags)
+            self._meme_by_kw[m.key] = m
+            for k in kws:
+                self._meme_by_kw.setdefault(k, m)
+                self._automaton.add_word(k, (len(k), k))
+            self.meme_keywords.extend(kws)
+        self._automaton.make_automaton()
+        self._keyword_set = frozenset(self.meme_keywords)
+        # 列表图渲染参数不随调用变化，加载时构建一次
+        if _IS_PY_VERSION:
+            self._meme_list_with_props = [
+                (m, MemeProperties(labels=[])) for m in self.memes
+            ]
+        else:
+            self._default_meme_props = {m.key: _MemeProperties() for m in self.memes}
+        self._rendered_list_cache = None
+        self._memes_loaded = True
 
     async def check_resources(self):
+        await self.load_memes()
         if not self.conf["is_check_resources"]:
             return
         logger.info("开始检查memes资源...")
-        if self.is_py_version:
-            asyncio.create_task(self.check_resources_func())
+        if _IS_PY_VERSION:
+            asyncio.create_task(_check_resources())
         else:
-            asyncio.create_task(asyncio.to_thread(self.check_resources_func))
+            asyncio.create_task(asyncio.to_thread(_check_resources))
 
     def find_meme(self, keyword: str) -> Meme | None:
-        for meme in self.memes:
-            keywords = meme.keywords if self.is_py_version else meme.info.keywords
-            if keyword == meme.key or keyword in keywords:
-                return meme
+        if not self._memes_loaded:
+            return None
+        return self._meme_by_kw.get(keyword)
 
     def is_meme_keyword(self, meme_name: str) -> bool:
-        return meme_name in self.meme_keywords
+        if not self._memes_loaded:
+            return False
+        return meme_name in self._keyword_set
 
     def match_meme_keyword(self, text: str, fuzzy_match: bool) -> str | None:
-        if fuzzy_match:
-            # 模糊匹配：检查关键词是否在消息字符串中
-            keyword = next((k for k in self.meme_keywords if k in text), None)
-        else:
-            # 精确匹配：检查关键词是否等于消息字符串的第一个单词
-            keyword = next(
-                (k for k in self.meme_keywords if k == text.split()[0]), None
-            )
-        return keyword
+        if not self._memes_loaded:
+            return None
+        # 精确匹配：检查关键词是否等于消息字符串的第一个单词（模糊匹配也先走这一步）
+        parts = text.split(None, 1)
+        if parts and parts[0] in self._keyword_set:
+            return parts[0]
+        if not fuzzy_match or not self.meme_keywords:
+            return None
+        # 模糊匹配：检查关键词是否在消息字符串中，多个命中时取最长的关键词
+        match = max(self._automaton.iter(text), key=lambda m: m[1][0], default=None)
+        return match[1][1] if match else None
 
     async def render_meme_list_image(self) -> bytes | None:
-        if self.is_py_version:
-            meme_list = [(m, MemeProperties(labels=[])) for m in self.memes]
-            return self.render_meme_list(
-                meme_list=meme_list,  # type: ignore
+        if not self._memes_loaded:
+            await self.load_memes()
+            if not self._memes_loaded:
+                return None
+        if self._rendered_list_cache is not None:
+            return self._rendered_list_cache
+        async with self._render_lock:
+            # 等锁期间可能已被其他调用渲染完成
+            if self._rendered_list_cache is None:
+                self._rendered_list_cache = await self._render_meme_list_image()
+        return self._rendered_list_cache
+
+    async def _render_meme_list_image(self) -> bytes | None:
+        if _IS_PY_VERSION:
+            return _render_meme_list(
+                meme_list=self._meme_list_with_props,  # type: ignore
                 text_template="{index}.{keywords}",
                 add_category_icon=True,
             ).getvalue()
         else:
-            meme_props = {m.key: MemeProperties() for m in self.memes}
-            return await asyncio.to_thread(
-                self.render_meme_list,
-                meme_properties=meme_props,
-                exclude_memes=[],
-                sort_by=MemeSortBy.KeywordsPinyin,
-                sort_reverse=False,
-                text_template="{index}. {keywords}",
-                add_category_icon=True,
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None,
+                functools.partial(
+                    _render_meme_list,
+                    meme_properties=self._default_meme_props,
+                    exclude_memes=[],
+                    sort_by=_MemeSortBy.KeywordsPinyin,
+                    sort_reverse=False,
+                    text_template="{index}. {keywords}",
+                    add_category_icon=True,
+                ),
             )
 
     def get_meme_info(self, keyword: str) -> tuple[str, bytes] | None:
@@ -104,41 +197,35 @@ class MemeManager:
         if not meme:
             return None
 
-        if self.is_py_version:
-            p = meme.params_type
-            keywords = meme.keywords
-            tags = meme.tags
-        else:
-            p = meme.info.params
-            keywords = meme.info.keywords
-            tags = meme.info.tags
+        keywords, p, tags = self._info[meme.key]
 
         # 组装信息字符串
-        meme_info = ""
+        parts: list[str] = []
         if meme.key:
-            meme_info += f"名称：{meme.key}\n"
+            parts.append(f"名称：{meme.key}")
         if keywords:
-            meme_info += f"别名：{keywords}\n"
+            parts.append(f"别名：{keywords}")
         if p.max_images > 0:
-            meme_info += (
-                f"所需图片：{p.min_images}张\n"
+            parts.append(
+                f"所需图片：{p.min_images}张"
                 if p.min_images == p.max_images
-                else f"所需图片：{p.min_images}~{p.max_images}张\n"
+                else f"所需图片：{p.min_images}~{p.max_images}张"
             )
         if p.max_texts > 0:
-            meme_info += (
-                f"所需文本：{p.min_texts}段\n"
+            parts.append(
+                f"所需文本：{p.min_texts}段"
                 if p.min_texts == p.max_texts
-                else f"所需文本：{p.min_texts}~{p.max_texts}段\n"
+                else f"所需文本：{p.min_texts}~{p.max_texts}段"
             )
         if p.default_texts:
-            meme_info += f"默认文本：{p.default_texts}\n"
+            parts.append(f"默认文本：{p.default_texts}")
         if tags:
-            meme_info += f"标签：{list(tags)}\n"
-        previewed = meme.generate_preview()
-        image: bytes = (
-            previewed.getvalue() if isinstance(previewed, io.BytesIO) else previewed
-        )
+            parts.append(f"标签：{list(tags)}")
+        meme_info = "\n".join(parts) + "\n" if parts else ""
+        # 旧版返回 BytesIO，新版直接返回 bytes，无需再拷贝
+        image = meme.generate_preview()
+        if isinstance(image, io.BytesIO):
+            image = image.getvalue()
         return meme_info, image
 
     async def generate_meme(
@@ -149,14 +236,110 @@ class MemeManager:
         if not meme:
             return
         # 收集参数
-        params = meme.params_type if self.is_py_version else meme.info.params
+        _, params, _ = self._info[meme.key]
         images, texts, options = await self.collect.collect_params(event, params)
 
-        if self.is_py_version:
+        # 图片指纹只算一次，同时用于并发去重和结果缓存
+        # 图片名称会作为用户昵称渲染进 meme，需一并纳入 key
+        img_keys = tuple(
+            (i[0], blake2b(i[1], digest_size=16).digest()) for i in images
+        )
+        key = (
+            meme.key,
+            tuple(texts),
+            tuple(sorted(options.items())),
+            img_keys,
+        )
+        if (cached := self._render_cache.get(key)) is not None:
+            self._render_cache.move_to_end(key)
+            return cached
+        if fut := self._inflight.get(key):
+            return await asyncio.shield(fut)
+        fut = asyncio.ensure_future(
+            self._generate_and_cache(key, meme, images, texts, options)
+        )
+        self._inflight[key] = fut
+        fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: 单个请求超时取消时，不影响其他等待同一结果的请求
+        return await asyncio.shield(fut)
+
+    async def _generate_and_cache(
+        self,
+        key: tuple,
+        meme: Meme,
+        images: list[tuple[str, bytes]],
+        texts: list[str],
+        options: dict,
+    ) -> bytes | None:
+        result = await self._generate(meme, images, texts, options)
+        # 带随机效果的 meme 命中缓存后结果会固定，因此缓存默认关闭
+        cache_size = self.conf["meme_cache_size"]
+        if isinstance(result, bytes) and cache_size > 0:
+            self._render_cache[key] = result
+            while len(self._render_cache) > cache_size:
+                self._render_cache.popitem(last=False)
+        return result
+
+    async def _generate(
+        self,
+        meme: Meme,
+        images: list[tuple[str, bytes]],
+        texts: list[str],
+        options: dict,
+    ) -> bytes | None:
+        if _IS_PY_VERSION:
             meme_images = [i[1] for i in images]
             return (
-                await self.run_sync(meme)(images=meme_images, texts=texts, args=options)
+                await _run_sync(meme)(images=meme_images, texts=texts, args=options)
             ).getvalue()
         else:
-            meme_images = [self.MemeImage(name=str(i[0]), data=i[1]) for i in images]
-            return await asyncio.to_thread(meme.generate, meme_images, texts, options)
+            loop = asyncio.get_running_loop()
+            if pool := self._get_render_pool():
+                try:
+                    result = await loop.run_in_executor(
+                        pool, _render_worker, meme.key, images, texts, options
+                    )
+                except BrokenProcessPool:
+                    # 子进程异常退出后进程池不可再用，丢弃以便下次重建
+                    logger.warning("meme生成进程池已损坏，将在下次生成时重建")
+                    self._discard_render_pool(pool)
+                    raise
+            else:
+                result = await loop.run_in_executor(
+                    None, _generate_meme, meme, images, texts, options
+                )
+            if isinstance(result, str):
+                logger.warning(f"meme生成失败: {meme.key}, {result}")
+                return None
+            return result
+
+    def _get_render_pool(self) -> ProcessPoolExecutor | None:
+        """
+        render_workers 大于 0 时使用进程池生成 meme，否则用线程池
+        子进程统一以 spawn 方式启动（避免 fork 多线程的事件循环进程），
+        每个子进程会重新导入本插件和 meme_generator 并加载一次 memes，
+        Python 3.11+ 下每个子进程生成 64 次后回收重建以释放内存
+        """
+        workers = self.conf["render_workers"]
+        if workers <= 0:
+            return None
+        if self._render_pool is None:
+            pool_kwargs = (
+                {"max_tasks_per_child": 64} if sys.version_info >= (3, 11) else {}
+            )
+            self._render_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                **pool_kwargs,
+            )
+        return self._render_pool
+
+    def _discard_render_pool(self, pool: ProcessPoolExecutor):
+        # 并发请求可能同时发现进程池损坏，只处理当前这一个
+        if self._render_pool is pool:
+            self._render_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        if self._render_pool:
+            self._render_pool.shutdown(wait=False, cancel_futures=True)
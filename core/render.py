@@ -0,0 +1,29 @@
+"""
+meme 生成（仅用于 meme_generator 0.2.0 及以上版本）
+本模块只依赖 meme_generator，进程池子进程导入它时无需加载 astrbot
+"""
+
+from meme_generator import Image, Meme, get_memes
+
+# 子进程内按 key 缓存的 memes
+_worker_memes: dict[str, Meme] | None = None
+
+
+def generate_meme(
+    meme: Meme, images: list[tuple[str, bytes]], texts: list[str], options: dict
+) -> bytes | str:
+    """生成 meme，失败时返回错误描述，保证结果可以跨进程传递"""
+    meme_images = [Image(name=str(i[0]), data=i[1]) for i in images]
+    result = meme.generate(meme_images, texts, options)
+    # 错误结果是无法 pickle 的 pyo3 对象，转成字符串
+    return result if isinstance(result, bytes) else repr(result)
+
+
+def render_worker(
+    key: str, images: list[tuple[str, bytes]], texts: list[str], options: dict
+) -> bytes | str:
+    """在进程池子进程中按 key 生成 meme"""
+    global _worker_memes
+    if _worker_memes is None:
+        _worker_memes = {m.key: m for m in get_memes()}
+    return generate_meme(_worker_memes[key], images, texts, options)
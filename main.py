@@ -141,3 +141,4 @@ class MemePlugin(Star):
     async def terminate(self):
         """插件终止时清理调度器"""
         await self.collector.close()
+        self.manager.close()